@@ -1,17 +1,22 @@
 import json
 from os import getenv, path
-from db import db, Course, User
-from flask import Flask, request, session
-from datetime import datetime
+from db import db, Course, User, CalendarEvent, course_students_table, add_missing_columns
+from flask import Flask, request, session, send_file
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, date, time, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from schedule_data import process_calendar_file, compress_availability, decompress_availability
 from icalendar import Calendar
 from dotenv import load_dotenv
-from schedule_data import constructor_availability, preference_comparison
+from schedule_data import constructor_availability, event_term, active_term, top_k_matches
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from random import sample
+from profiling import init_profiling, is_authorized, list_profiles, profile_artifact_path, ARTIFACT_KINDS
+from availability_store import init_availability_store, store_user, packed_entry, packed_entries
+from calendar_index import calendar_event_fields, common_free_slots, users_without_events, MAX_WINDOW_DAYS
+from search_index import init_search_index, autocomplete_users, autocomplete_courses, AUTOCOMPLETE_DEFAULT_LIMIT, AUTOCOMPLETE_MAX_LIMIT
 
 load_dotenv()
 
@@ -23,14 +28,23 @@ app = Flask(__name__)
 print(getenv("FLASK_SECRET_KEY"))
 app.secret_key = getenv("FLASK_SECRET_KEY")
 
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///data.db"
+app.config["SQLALCHEMY_DATABASE_URI"] = getenv("DATABASE_URL", f"sqlite:///{db_filename}")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ECHO"] = True
+app.config["SQLALCHEMY_ECHO"] = getenv("SQLALCHEMY_ECHO", "true").lower() == "true"
+
+# SMTP server used for match emails (overridable so load tests can use a local sink)
+SMTP_HOST = getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(getenv("SMTP_PORT", "587"))
+SMTP_USE_TLS = getenv("SMTP_USE_TLS", "true").lower() == "true"
 
 # initialize app
 db.init_app(app)
 with app.app_context():
     db.create_all()
+    add_missing_columns(active_term())
+init_profiling(app)
+init_search_index(app)
+init_availability_store(app)
 
 # generalized response formats
 def success_response(data, code=200):
@@ -40,8 +54,8 @@ def failure_response(message, code=404):
 
 
 #### NON-API ROUTES ------------------------------------------------------
-def clear_users_courses(user_id):
-    """Remove the currently logged-in user from all their courses"""
+def clear_users_courses(user_id, terms=None):
+    """Remove the currently logged-in user from all their courses, or only those in the given terms"""
     if "user_id" not in session:
         return failure_response("Not logged in", 401)
     
@@ -49,8 +63,11 @@ def clear_users_courses(user_id):
     if user_id is None:
         return failure_response("User not found", 404)
     
-    # Clear all courses for this user
-    user_id.student_courses = []
+    # Clear all courses for this user (courses from other terms are kept)
+    if terms is None:
+        user_id.student_courses = []
+    else:
+        user_id.student_courses = [c for c in user_id.student_courses if c.term not in terms]
     db.session.commit()
     
     return success_response("User is no longer enrolled in any courses")
@@ -187,6 +204,7 @@ def upload_file():
         
     user_course_set = set()
     user_unavailability_blocks = []
+    user_calendar_events = []
 
     # Iterate through calendar components
     for component in cal.walk():
@@ -195,36 +213,62 @@ def upload_file():
             period = component.get('summary')
             dtstart = component.get('dtstart').dt
             dtend = component.get('dtend').dt
+            term = event_term(dtstart, component.get('rrule'))
             
-            user_course_set.add(period.split(",")[0])
+            user_course_set.add((period.split(",")[0], term))
             user_unavailability_blocks.append((dtstart, dtend))
+            
+            # Keep the event itself for date-aware availability
+            fields = calendar_event_fields(component)
+            if fields is not None:
+                user_calendar_events.append(CalendarEvent(term=term, **fields))
 
     # Get current user
     user = User.query.filter_by(id=session["user_id"]).first()
-    clear_users_courses(user)
-
-    for course_name in user_course_set:
-        # Find or create the course
+    # A calendar without events clears everything, like before courses had terms
+    uploaded_terms = {term for _, term in user_course_set} or None
+    clear_users_courses(user, uploaded_terms)
+    
+    # Replace the user's events for the uploaded terms
+    stale_events = CalendarEvent.query.filter(CalendarEvent.user_id == user.id)
+    if uploaded_terms is not None:
+        stale_events = stale_events.filter(CalendarEvent.term.in_(uploaded_terms))
+    stale_events.delete(synchronize_session=False)
+    for event in user_calendar_events:
+        event.user_id = user.id
+        db.session.add(event)
+
+    for course_name, term in user_course_set:
+        # Find or create the course for this term
         # Note: Course requires both code and name
-        course = Course.query.filter_by(name=course_name).first()
+        course = Course.query.filter_by(name=course_name, term=term).first()
         if course is None:
-            course = Course(
-                code=course_name,  
-                name=course_name
-            )
-            db.session.add(course)
+            try:
+                # Savepoint, so losing a race with another upload only undoes this insert
+                with db.session.begin_nested():
+                    course = Course(
+                        code=course_name,  
+                        name=course_name,
+                        term=term
+                    )
+                    db.session.add(course)
+            except IntegrityError:
+                course = Course.query.filter_by(name=course_name, term=term).one()
         
         
         
         # Add user as student if not already in course
-        if user not in course.students:
+        # (checked from the user's side so the whole roster isn't loaded)
+        if course not in user.student_courses:
             course.students.append(user)
             # The reciprocal relationship will be automatically handled
             # because we defined back_populates in the models
     
     user.availability = constructor_availability(user_unavailability_blocks)
+    user.data_version = User.data_version + 1
     
     db.session.commit()
+    store_user(user)
     
     return success_response({"message": "Calendar processed successfully"})
 
@@ -265,8 +309,10 @@ def update_preferences():
             if not isinstance(body[pref], bool):
                 return failure_response(f"Preference {pref} must be a boolean value", 400)
             setattr(user, pref, body[pref])
+    user.data_version = User.data_version + 1
     
     db.session.commit()
+    store_user(user)
     
     return success_response({
         "message": "Preferences updated successfully",
@@ -366,8 +412,9 @@ def send_match_email():
         
         try:
             # Create SMTP session
-            server = smtplib.SMTP('smtp.gmail.com', 587)
-            server.starttls()
+            server = smtplib.SMTP(SMTP_HOST, SMTP_PORT)
+            if SMTP_USE_TLS:
+                server.starttls()
             server.login(sender_email, sender_password)
             
             # Send email
@@ -380,58 +427,137 @@ def send_match_email():
 
 @app.route("/api/search/")
 def search_results():
-    """Get search results for a user, sorted by match score"""
+    """Get search results for a user, sorted by match score
+    
+    Optional query parameters:
+    - limit: number of matches to return (default 10, max 50)
+    - offset: number of top matches to skip, for paging
+    """
     SEARCH_LIMIT = 10
+    SEARCH_MAX_LIMIT = 50
     
     if "user_id" not in session:
         return failure_response("Not logged in", 401)
     
+    try:
+        limit = int(request.args.get("limit", SEARCH_LIMIT))
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return failure_response("limit and offset must be integers", 400)
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    offset = max(0, offset)
+    
     user = User.query.get(session["user_id"])
     if user is None:
         return failure_response("User not found", 404)
     
-    # Get all coursemates
-    coursemates = set()  # Using set to avoid duplicates
-    coursemate_courses = {}  # Dictionary to track shared courses
+    # Get all coursemates from the active term (past terms are archived or ignored),
+    # reading only ids, shared course codes and data versions rather than whole rows
+    term = active_term()
+    course_ids = [course.id for course in user.student_courses if course.term == term]
+    rows = (
+        db.session.query(course_students_table.c.user_id, Course.code, User.data_version)
+        .join(Course, Course.id == course_students_table.c.course_id)
+        .join(User, User.id == course_students_table.c.user_id)
+        .filter(course_students_table.c.course_id.in_(course_ids))
+        .filter(course_students_table.c.user_id != user.id)
+        .all()
+    ) if course_ids else []
     
-    for course in user.student_courses:
-        for student in course.students:
-            if student.id != user.id:  # Exclude the current user
-                coursemates.add(student)
-                # Track shared courses for each coursemate
-                if student.id not in coursemate_courses:
-                    coursemate_courses[student.id] = set()
-                coursemate_courses[student.id].add(course)
+    coursemate_courses = {}  # Dictionary to track shared courses
+    coursemate_versions = {}
+    for student_id, code, version in rows:
+        coursemate_courses.setdefault(student_id, set()).add(code)
+        coursemate_versions[student_id] = version
     
-    if len(coursemates) == 0:
+    if len(coursemate_versions) == 0:
         return failure_response("No coursemates found", 404)
     
-    # Calculate scores and build response data
+    # Score with a bounded heap, pruning coursemates who cannot make the page
+    user_bits, user_prefs = packed_entry(user)
+    ranked, _ = top_k_matches(user_bits, user_prefs, packed_entries(coursemate_versions), offset + limit)
+    ranked = ranked[offset:]
+    
+    # Build response data only for the returned page
+    coursemates = {u.id: u for u in User.query.filter(User.id.in_([uid for _, uid in ranked])).all()}
     matches = []
-    for coursemate in coursemates:
-        score = preference_comparison(user, coursemate)
-        
-        common_prefs = get_common_preferences(user.id, coursemate.id)
-
+    for score, coursemate_id in ranked:
+        coursemate = coursemates[coursemate_id]
         matches.append({
             "name": coursemate.name,
             "netid": coursemate.netid,
             "match_score": score,
-            "common_courses": [course.code for course in coursemate_courses[coursemate.id]],
-            "common_preferences": common_prefs
+            "common_courses": sorted(coursemate_courses[coursemate_id]),
+            "common_preferences": get_common_preferences(user.id, coursemate_id)
         })
     
-    # Sort by match score (highest first)
-    matches.sort(key=lambda x: x["match_score"], reverse=True)
+    return success_response({
+        "matches": matches
+    })
+
+@app.route("/api/free-slots/")
+def get_free_slots():
+    """Find times in a date range when the logged-in user and other users are all free
+    
+    Query parameters:
+    - netids: comma separated netids to compare with (optional, defaults to just the current user)
+    - start, end: ISO dates, inclusive (e.g. 2024-12-02 and 2024-12-08)
+    - min_minutes: shortest slot to return (default 30)
+    - day_start, day_end: hours searched each day (default 08:00 and 22:00)
     
-    # Limit number of results
-    if len(matches) > SEARCH_LIMIT:
-        matches = matches[:SEARCH_LIMIT]
+    Free slots come from the calendar events stored at upload time. Users with
+    no stored events (e.g. calendars uploaded before events were stored) are
+    listed under "no_calendar" and ignored until they upload their calendar again.
+    """
+    if "user_id" not in session:
+        return failure_response("Not logged in", 401)
+    
+    user = User.query.get(session["user_id"])
+    if user is None:
+        return failure_response("User not found", 404)
     
-    print(matches)
+    try:
+        start = date.fromisoformat(request.args["start"])
+        end = date.fromisoformat(request.args["end"])
+        min_minutes = int(request.args.get("min_minutes", 30))
+        day_start = time.fromisoformat(request.args.get("day_start", "08:00"))
+        day_end = time.fromisoformat(request.args.get("day_end", "22:00"))
+    except KeyError:
+        return failure_response("start and end dates are required", 400)
+    except ValueError:
+        return failure_response("Invalid date, time or min_minutes", 400)
+    
+    if end < start:
+        return failure_response("end must not be before start", 400)
+    if (end - start).days >= MAX_WINDOW_DAYS:
+        return failure_response(f"Date range can be at most {MAX_WINDOW_DAYS} days", 400)
+    
+    netids = [n.strip() for n in request.args.get("netids", "").split(",") if n.strip()]
+    others = User.query.filter(User.netid.in_(netids)).all() if netids else []
+    missing = set(netids) - {other.netid for other in others}
+    if missing:
+        return failure_response(f"Users not found: {', '.join(sorted(missing))}", 404)
+    
+    window_start = datetime.combine(start, time.min)
+    window_end = datetime.combine(end + timedelta(days=1), time.min)
+    users = [user] + [other for other in others if other.id != user.id]
+    no_calendar = users_without_events(users)
+    scheduled = [u for u in users if u not in no_calendar]
+    slots = common_free_slots(scheduled, window_start, window_end, day_start, day_end, max(1, min_minutes)) if scheduled else []
     
     return success_response({
-        "matches": matches
+        "netids": [u.netid for u in scheduled],
+        "no_calendar": [u.netid for u in no_calendar],
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "free_slots": [
+            {
+                "start": slot_start.isoformat(),
+                "end": slot_end.isoformat(),
+                "minutes": int((slot_end - slot_start).total_seconds() // 60)
+            }
+            for slot_start, slot_end in slots
+        ]
     })
 
 @app.route("/api/preferences/")
@@ -464,6 +590,54 @@ def get_all_users():
     users = User.query.all()
     return success_response([user.serialize() for user in users])
 
+def autocomplete_args():
+    """Read the q and limit query parameters shared by the autocomplete routes"""
+    query = request.args.get("q", "").strip()
+    try:
+        limit = int(request.args.get("limit", AUTOCOMPLETE_DEFAULT_LIMIT))
+    except ValueError:
+        return query, None
+    return query, max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+
+@app.route("/api/autocomplete/users/")
+def autocomplete_user_names():
+    """Autocomplete users by name or netid prefix"""
+    query, limit = autocomplete_args()
+    if limit is None:
+        return failure_response("limit must be an integer", 400)
+    if not query:
+        return success_response({"results": []})
+    return success_response({"results": autocomplete_users(query, limit)})
+
+@app.route("/api/autocomplete/courses/")
+def autocomplete_course_codes():
+    """Autocomplete course codes in the active term (or the term given by ?term=)"""
+    query, limit = autocomplete_args()
+    if limit is None:
+        return failure_response("limit must be an integer", 400)
+    if not query:
+        return success_response({"results": []})
+    term = request.args.get("term") or active_term()
+    return success_response({"results": autocomplete_courses(query, term, limit)})
+
+@app.route("/api/admin/profiles/")
+def get_profiles():
+    """List recently captured request profiles"""
+    if not is_authorized(request):
+        return failure_response("Not authorized", 403)
+    return success_response({"profiles": list_profiles()})
+
+@app.route("/api/admin/profiles/<string:profile_id>/<string:kind>/")
+def download_profile(profile_id, kind):
+    """Download one artifact (json, pstats or collapsed) of a captured profile"""
+    if not is_authorized(request):
+        return failure_response("Not authorized", 403)
+    artifact = profile_artifact_path(profile_id, kind)
+    if artifact is None:
+        return failure_response("Profile not found")
+    return send_file(artifact, mimetype=ARTIFACT_KINDS[kind], as_attachment=True,
+                     download_name=f"{profile_id}.{kind}")
+
 @app.route("/api")
 def greet():
     return success_response({"message": "Hello, welcome to the study buddy app!"})
@@ -0,0 +1,62 @@
+"""
+Archival of past-term enrollments.
+
+Moves course_students rows for courses in terms before the active term into
+the archived_course_students cold table, so the hot enrollment table (and the
+rosters search walks) only ever hold the current semester.
+
+Run from the src directory:
+    python archive.py            # archive everything before the active term
+    python archive.py --term SP25
+"""
+import argparse
+from sqlalchemy import delete, insert, select
+from db import db, Course, course_students_table, archived_course_students_table
+from schedule_data import active_term, term_sort_key
+
+
+def past_terms(current):
+    """Return the distinct course terms that come before the given term"""
+    terms = [term for (term,) in db.session.query(Course.term).distinct() if term]
+    return sorted((t for t in terms if term_sort_key(t) < term_sort_key(current)), key=term_sort_key)
+
+def archive_past_terms(current=None):
+    """
+    Move enrollments of past-term courses into the archive table
+
+    Args:
+        current: term code to treat as active, defaults to active_term()
+
+    Returns:
+        dict: the archived terms and the number of enrollments moved
+    """
+    current = current or active_term()
+    terms = past_terms(current)
+    if not terms:
+        return {"terms": [], "archived": 0}
+
+    past_courses = select(Course.id).where(Course.term.in_(terms))
+    enrollments = (
+        select(course_students_table.c.course_id, course_students_table.c.user_id, Course.term)
+        .join(Course, Course.id == course_students_table.c.course_id)
+        .where(Course.term.in_(terms))
+    )
+    db.session.execute(
+        insert(archived_course_students_table).from_select(["course_id", "user_id", "term"], enrollments)
+    )
+    result = db.session.execute(
+        delete(course_students_table).where(course_students_table.c.course_id.in_(past_courses))
+    )
+    db.session.commit()
+    return {"terms": terms, "archived": result.rowcount}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive enrollments from terms before the active term")
+    parser.add_argument("--term", help="term to treat as active (default: ACTIVE_TERM or today's term)")
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        summary = archive_past_terms(args.term)
+    print(f"Archived {summary['archived']} enrollments from terms: {', '.join(summary['terms']) or 'none'}")
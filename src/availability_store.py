@@ -0,0 +1,272 @@
+"""
+Shared, memory-mapped store of packed availability and preference bits.
+
+Every worker process on a host maps the same file, so a user's 224-block
+availability and 9 preference flags are decoded once and then read zero-copy
+by all workers, instead of each worker re-decoding User.availability strings.
+
+File layout (little endian):
+    header  magic "SBAV", format, slot size, capacity, generation (64 bytes)
+    slots   one 40-byte slot per user id:
+            seq u32 | version u32 | flags u16 | preferences u16 | availability 28 bytes
+
+Write protocol: writers serialize on a thread lock and an flock (the flock only
+excludes other processes), bump the slot's seq to an odd value, write the
+payload, then bump seq to the next even value. Readers retry while seq is odd
+or changes under them, so a torn or crashed write is never returned. Maps are
+replaced, never closed, when the file grows, so readers need no lock. Each slot also carries the User.data_version it was built from; a
+mismatch means the row changed (possibly on another host) and the slot is
+rebuilt from the ORM object and written back.
+"""
+import fcntl
+import hashlib
+from contextlib import contextmanager
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from os import getenv, path
+from db import User
+
+PREFERENCE_FIELDS = [
+    "location_north", "location_south", "location_central", "location_west",
+    "time_morning", "time_afternoon", "time_evening",
+    "objective_study", "objective_homework"
+]
+BLOCKS = 32 * 7
+
+MAGIC = b"SBAV"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHIQ")
+HEADER_SIZE = 64
+SLOT = struct.Struct("<IIHH28s")
+GENERATION_OFFSET = 12
+MIN_CAPACITY = 1024
+
+FLAG_PRESENT = 1
+FLAG_HAS_AVAILABILITY = 2
+
+
+def pack_availability(compressed):
+    """
+    Pack a compressed availability string ("3c2a3") into an int bitset,
+    bit i set when block i is free. Returns None for a missing schedule.
+    """
+    if not compressed:
+        return None
+    bits = 0
+    position = 0
+    number_buffer = ""
+    for char in compressed:
+        if char.isdigit():
+            number_buffer += char
+            continue
+        if number_buffer:
+            run = int(number_buffer)
+            bits |= ((1 << run) - 1) << position
+            position += run
+            number_buffer = ""
+        position += ord(char) - ord('a') + 1
+    if number_buffer:
+        run = int(number_buffer)
+        bits |= ((1 << run) - 1) << position
+    return bits & ((1 << BLOCKS) - 1)
+
+def pack_preferences(user):
+    """Pack the user's boolean preference columns into a bitmask (PREFERENCE_FIELDS order)"""
+    mask = 0
+    for i, field in enumerate(PREFERENCE_FIELDS):
+        if getattr(user, field):
+            mask |= 1 << i
+    return mask
+
+
+class AvailabilityStore:
+    """A memory-mapped array of per-user slots shared by every process that opens the same file"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o600)
+        # Guards writes and remapping between threads; _locked() adds the cross-process flock
+        self._lock = threading.Lock()
+        with self._locked():
+            if os.fstat(self.fd).st_size < HEADER_SIZE or self._read_header_from_fd()[0] != MAGIC:
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, HEADER_SIZE)
+                os.pwrite(self.fd, HEADER.pack(MAGIC, FORMAT_VERSION, SLOT.size, 0, 0), 0)
+        self._map = None
+        self._remap()
+
+    def _read_header_from_fd(self):
+        return HEADER.unpack(os.pread(self.fd, HEADER.size, 0))
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock against other threads of this process and every other process writing this file"""
+        with self._lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _remap(self):
+        """
+        Map the file at its current size. The old map is not closed: readers in
+        other threads may still hold it, and it is released with its last reference.
+        Call with self._lock held (or before the store is shared).
+        """
+        self._map = mmap.mmap(self.fd, os.fstat(self.fd).st_size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+    def _mapping(self, user_id, grow=False):
+        """
+        The map and byte offset of a user's slot, remapping (or growing the file)
+        as needed; (map, None) if out of range. Growing requires self._locked().
+        """
+        offset = HEADER_SIZE + user_id * SLOT.size
+        current = self._map
+        if offset + SLOT.size <= len(current):
+            return current, offset
+        if not grow:
+            if os.fstat(self.fd).st_size < offset + SLOT.size:
+                return current, None
+            with self._lock:
+                if offset + SLOT.size > len(self._map):
+                    self._remap()
+                return self._map, offset
+        if os.fstat(self.fd).st_size < offset + SLOT.size:
+            capacity = HEADER.unpack_from(current, 0)[3]
+            capacity = max(user_id + 1, capacity * 2, MIN_CAPACITY)
+            os.ftruncate(self.fd, HEADER_SIZE + capacity * SLOT.size)
+            struct.pack_into("<I", current, 8, capacity)
+        self._remap()
+        return self._map, offset
+
+    @property
+    def generation(self):
+        """Number of writes ever made to this store, across all processes"""
+        return struct.unpack_from("<Q", self._map, GENERATION_OFFSET)[0]
+
+    def read(self, user_id, retries=3):
+        """
+        Read a user's slot
+
+        Returns:
+            tuple or None: (version, availability bits or None, preference mask), or None
+            if the slot is empty or was mid-write
+        """
+        current, offset = self._mapping(user_id)
+        if offset is None:
+            return None
+        for _ in range(retries):
+            seq, version, flags, prefs, raw = SLOT.unpack_from(current, offset)
+            if seq & 1:
+                continue
+            if struct.unpack_from("<I", current, offset)[0] != seq:
+                continue
+            if not flags & FLAG_PRESENT:
+                return None
+            bits = int.from_bytes(raw, "little") if flags & FLAG_HAS_AVAILABILITY else None
+            return version, bits, prefs
+        return None
+
+    def write(self, user_id, version, bits, prefs):
+        """Write a user's slot using the seqlock protocol"""
+        flags = FLAG_PRESENT | (FLAG_HAS_AVAILABILITY if bits is not None else 0)
+        raw = (bits or 0).to_bytes(28, "little")
+        with self._locked():
+            current, offset = self._mapping(user_id, grow=True)
+            seq = struct.unpack_from("<I", current, offset)[0]
+            odd = (seq | 1) + (2 if seq & 1 else 0)
+            struct.pack_into("<I", current, offset, odd & 0xFFFFFFFF)
+            struct.pack_into("<IHH28s", current, offset + 4, version, flags, prefs, raw)
+            struct.pack_into("<I", current, offset, (odd + 1) & 0xFFFFFFFF)
+            generation = struct.unpack_from("<Q", current, GENERATION_OFFSET)[0]
+            struct.pack_into("<Q", current, GENERATION_OFFSET, generation + 1)
+
+    def store_user(self, user):
+        """Pack a User row into its slot and return (bits, prefs)"""
+        bits = pack_availability(user.availability)
+        prefs = pack_preferences(user)
+        self.write(user.id, user.data_version or 0, bits, prefs)
+        return bits, prefs
+
+    def lookup(self, user):
+        """
+        Return (availability bits, preference mask) for a User, from the shared
+        slot when it is current, otherwise rebuilt from the row and written back
+        """
+        entry = self.read(user.id)
+        if entry is not None and entry[0] == (user.data_version or 0):
+            return entry[1], entry[2]
+        return self.store_user(user)
+
+    def close(self):
+        with self._lock:
+            self._map.close()
+            os.close(self.fd)
+
+
+#### SHARED INSTANCE -----------------------------------------------------
+_store = None
+
+def packed_entry(user):
+    """(availability bits, preference mask) for a User, via the store when enabled"""
+    if _store is not None:
+        return _store.lookup(user)
+    return pack_availability(user.availability), pack_preferences(user)
+
+def packed_entries(versions):
+    """
+    Packed (user id, availability bits, preference mask) for many users
+
+    Args:
+        versions: dict of user id -> User.data_version, as read from the database
+
+    Slots whose version matches are read straight from the store; the remaining
+    users are loaded from the ORM in one query (and written back to the store).
+    """
+    entries = []
+    missing = []
+    for user_id, version in versions.items():
+        entry = _store.read(user_id) if _store is not None else None
+        if entry is not None and entry[0] == (version or 0):
+            entries.append((user_id, entry[1], entry[2]))
+        else:
+            missing.append(user_id)
+    if missing:
+        for user in User.query.filter(User.id.in_(missing)).all():
+            entries.append((user.id, *packed_entry(user)))
+    return entries
+
+def default_store_path(database_uri):
+    """A per-database file in shared memory, so different databases never share slots"""
+    directory = "/dev/shm" if path.isdir("/dev/shm") else tempfile.gettempdir()
+    digest = hashlib.sha1(database_uri.encode()).hexdigest()[:12]
+    return path.join(directory, f"studybuddy-availability-{digest}.bin")
+
+def get_store():
+    """The store opened by init_availability_store, or None when it is disabled"""
+    return _store
+
+def store_user(user):
+    """Refresh a user's slot after their calendar or preferences change"""
+    if _store is not None:
+        _store.store_user(user)
+
+def init_availability_store(app):
+    """
+    Open (or create) the host's shared store and backfill it from the database
+    the first time any worker opens it. Disabled with AVAILABILITY_STORE=off.
+    """
+    global _store
+    if getenv("AVAILABILITY_STORE", "on").lower() == "off":
+        return
+    filename = getenv("AVAILABILITY_STORE_PATH") or default_store_path(app.config["SQLALCHEMY_DATABASE_URI"])
+    _store = AvailabilityStore(filename)
+    if _store.generation > 0:
+        return
+    with app.app_context():
+        for user in User.query.yield_per(1000):
+            _store.store_user(user)
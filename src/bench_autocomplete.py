@@ -0,0 +1,96 @@
+"""
+Benchmark: autocomplete latency at 100k users.
+
+Bulk loads a scratch database, rebuilds the text index and times
+/api/autocomplete/users/ and /api/autocomplete/courses/ for random 2-5
+character prefixes, with the FTS5 index and with the prefix LIKE fallback.
+
+    python bench_autocomplete.py --users 100000 --courses 5000
+"""
+import argparse
+import json
+import random
+import string
+import tempfile
+import time
+from os import environ, path
+from loadtest import percentile
+
+FIRST_NAMES = ["Alex", "Nathnael", "Sam", "Jordan", "Priya", "Wei", "Maria", "Omar", "Grace", "Ethan",
+               "Fatima", "Lucas", "Aisha", "Diego", "Hana", "Noah", "Zoe", "Ravi", "Lena", "Kofi"]
+LAST_NAMES = ["Tesfaye", "Smith", "Chen", "Garcia", "Patel", "Kim", "Nguyen", "Okafor", "Rossi", "Cohen",
+              "Haddad", "Silva", "Ivanova", "Mensah", "Larsen", "Tanaka", "Murphy", "Khan", "Bauer", "Adams"]
+SUBJECTS = ["CS", "MATH", "PHYS", "CHEM", "ENGRI", "ECON", "BIOG", "ORIE", "ECE", "MAE", "INFO", "PSYCH"]
+
+
+def time_queries(client, url, prefixes):
+    """Issue one request per prefix and return (p50 ms, p95 ms, mean results)"""
+    timings = []
+    results = 0
+    for prefix in prefixes:
+        start = time.perf_counter()
+        response = client.get(url, query_string={"q": prefix, "limit": 10})
+        timings.append(time.perf_counter() - start)
+        results += len(json.loads(response.data)["results"])
+    timings.sort()
+    return percentile(timings, 50) * 1000, percentile(timings, 95) * 1000, results / len(prefixes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Autocomplete latency at scale")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--courses", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="studybuddy-bench-")
+    environ["DATABASE_URL"] = "sqlite:///" + path.join(scratch, "bench.db")
+    environ["AVAILABILITY_STORE_PATH"] = path.join(scratch, "availability.bin")
+    environ["SQLALCHEMY_ECHO"] = "false"
+    environ["ACTIVE_TERM"] = "FA24"
+    environ.setdefault("FLASK_SECRET_KEY", "bench-secret")
+
+    from app import app
+    from db import db, User, Course
+    from sqlalchemy import insert
+    import search_index
+
+    rng = random.Random(args.seed)
+    with app.app_context():
+        start = time.perf_counter()
+        users = [{
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "netid": "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 3))) + str(rng.randint(1, 9999)),
+            "password": "x",
+        } for _ in range(args.users)]
+        db.session.execute(insert(User.__table__), users)
+        codes = sorted({f"{rng.choice(SUBJECTS)} {rng.randint(1000, 7999)}" for _ in range(args.courses)})
+        terms = ["SP24", "FA24"]
+        db.session.execute(insert(Course.__table__),
+                           [{"code": code, "name": code, "term": term} for code in codes for term in terms])
+        db.session.commit()
+        search_index.rebuild_search_index()
+        print(f"Loaded {args.users} users and {len(codes) * len(terms)} courses in {time.perf_counter() - start:.1f}s "
+              f"(backend: {search_index.search_backend()})")
+
+    user_prefixes = []
+    for _ in range(args.queries):
+        user = rng.choice(users)
+        source = rng.choice([user["netid"], user["name"].split()[rng.randint(0, 1)]])
+        user_prefixes.append(source[:rng.randint(2, 5)].lower())
+    course_prefixes = [rng.choice(codes)[:rng.randint(2, 7)] for _ in range(args.queries)]
+
+    client = app.test_client()
+    print(f"{'backend':<8} {'endpoint':<9} {'p50 ms':>8} {'p95 ms':>8} {'avg hits':>9}")
+    backends = [search_index.search_backend()] + (["prefix"] if search_index.search_backend() == "fts5" else [])
+    for backend in backends:
+        search_index._backend = backend
+        for name, url, prefixes in [("users", "/api/autocomplete/users/", user_prefixes),
+                                    ("courses", "/api/autocomplete/courses/", course_prefixes)]:
+            p50, p95, hits = time_queries(client, url, prefixes)
+            print(f"{backend:<8} {name:<9} {p50:>8.2f} {p95:>8.2f} {hits:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark: shared availability store vs decoding User rows.
+
+Loads a scratch database of users, then compares
+    orm     orm_preference_comparison on User objects (decodes availability strings)
+    store   preference_comparison reading packed bits from the shared mmap store
+    bits    bitset_preference_comparison on slots read by user id alone
+and checks that all three agree. It then forks worker processes that each
+score against every user and reports per-worker memory: the private bytes a
+worker needs for a decoded-availability cache versus the bytes of the shared
+mapping that are private to the worker (the rest are shared page cache).
+
+    python bench_availability_store.py --users 20000 --pairs 200000 --workers 4
+"""
+import argparse
+import multiprocessing
+import random
+import tempfile
+import time
+import tracemalloc
+from os import environ, path
+
+
+def mapping_memory(filename):
+    """(Rss, Private) kB of this process's mappings of the given file, from /proc/self/smaps"""
+    rss = private = 0
+    inside = False
+    with open("/proc/self/smaps") as f:
+        for line in f:
+            fields = line.split()
+            if "-" in fields[0] and len(fields) >= 5:
+                inside = fields[-1] == filename
+            elif inside and fields[0] == "Rss:":
+                rss += int(fields[1])
+            elif inside and fields[0] in ("Private_Clean:", "Private_Dirty:"):
+                private += int(fields[1])
+    return rss, private
+
+def worker_memory(args):
+    """Score one user against everyone with each approach and report the memory it took"""
+    user_ids, availability_rows, store_path = args
+    from availability_store import AvailabilityStore
+    from schedule_data import decompress_availability, bitset_preference_comparison
+
+    # Per-worker cache of decoded availability strings, what each worker builds today
+    tracemalloc.start()
+    decoded = {uid: decompress_availability(avail) for uid, avail in availability_rows}
+    cache_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del decoded
+
+    store = AvailabilityStore(store_path)
+    _, bits, prefs = store.read(user_ids[0])
+    for uid in user_ids:
+        entry = store.read(uid)
+        if entry is not None:
+            bitset_preference_comparison(bits, prefs, entry[1], entry[2])
+    rss, private = mapping_memory(store_path)
+    return cache_bytes, rss * 1024, private * 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared availability store benchmark")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--pairs", type=int, default=200000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="studybuddy-bench-")
+    environ["DATABASE_URL"] = "sqlite:///" + path.join(scratch, "bench.db")
+    environ["AVAILABILITY_STORE_PATH"] = path.join(scratch, "availability.bin")
+    environ["SQLALCHEMY_ECHO"] = "false"
+    environ.setdefault("FLASK_SECRET_KEY", "bench-secret")
+
+    from app import app
+    from db import db, User
+    from availability_store import PREFERENCE_FIELDS, get_store
+    from schedule_data import (compress_availability, orm_preference_comparison,
+                               preference_comparison, bitset_preference_comparison)
+
+    rng = random.Random(args.seed)
+    with app.app_context():
+        users = []
+        for i in range(args.users):
+            user = User(name=f"Student {i}", netid=f"ba{i}", password="x")
+            if rng.random() < 0.95:
+                user.availability = compress_availability("".join(rng.choice("0111") for _ in range(32 * 7)))
+            for pref in PREFERENCE_FIELDS:
+                setattr(user, pref, rng.random() < 0.5)
+            users.append(user)
+        db.session.add_all(users)
+        db.session.commit()
+        users = User.query.all()
+
+        store = get_store()
+        for user in users:
+            store.store_user(user)
+
+        pairs = [(rng.choice(users), rng.choice(users)) for _ in range(args.pairs)]
+
+        start = time.perf_counter()
+        orm_scores = [orm_preference_comparison(a, b) for a, b in pairs]
+        orm_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store_scores = [preference_comparison(a, b) for a, b in pairs]
+        store_elapsed = time.perf_counter() - start
+
+        id_pairs = [(a.id, b.id) for a, b in pairs]
+        start = time.perf_counter()
+        bit_scores = []
+        for a, b in id_pairs:
+            _, bits1, prefs1 = store.read(a)
+            _, bits2, prefs2 = store.read(b)
+            bit_scores.append(bitset_preference_comparison(bits1, prefs1, bits2, prefs2))
+        bits_elapsed = time.perf_counter() - start
+
+        assert orm_scores == store_scores == bit_scores, "scores differ between paths"
+        print(f"{'path':<6} {'pairs/s':>12} {'speedup':>8}")
+        for name, elapsed in [("orm", orm_elapsed), ("store", store_elapsed), ("bits", bits_elapsed)]:
+            print(f"{name:<6} {args.pairs / elapsed:>12,.0f} {orm_elapsed / elapsed:>7.1f}x")
+
+        user_ids = [u.id for u in users]
+        availability_rows = [(u.id, u.availability) for u in users if u.availability]
+
+    store_path = environ["AVAILABILITY_STORE_PATH"]
+    with multiprocessing.get_context("fork").Pool(args.workers) as pool:
+        results = pool.map(worker_memory, [(user_ids, availability_rows, store_path)] * args.workers)
+    print(f"\nstore file: {path.getsize(store_path) / 1024:,.0f} kB shared by all workers")
+    print(f"{'worker':<7} {'decoded cache kB':>17} {'store rss kB':>13} {'store private kB':>17}")
+    for i, (cache_bytes, rss, private) in enumerate(results):
+        print(f"{i:<7} {cache_bytes / 1024:>17,.0f} {rss / 1024:>13,.0f} {private / 1024:>17,.0f}")
+
+
+if __name__ == "__main__":
+    main()
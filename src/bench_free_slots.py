@@ -0,0 +1,83 @@
+"""
+Benchmark: date-aware free-slot queries over term-long windows.
+
+Gives every user a generated term schedule, then times common_free_slots for
+pairs and groups over a one-week window and the whole term, both cold (events
+loaded and recurrences expanded) and warm (cached BusyIndex per user).
+
+    python bench_free_slots.py --users 500 --queries 200
+"""
+import argparse
+import random
+import tempfile
+import time
+from datetime import date, datetime
+from os import environ, path
+from loadtest import percentile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Free-slot query benchmark")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="studybuddy-bench-")
+    environ["DATABASE_URL"] = "sqlite:///" + path.join(scratch, "bench.db")
+    environ["AVAILABILITY_STORE_PATH"] = path.join(scratch, "availability.bin")
+    environ["SQLALCHEMY_ECHO"] = "false"
+    environ.setdefault("FLASK_SECRET_KEY", "bench-secret")
+
+    from app import app
+    from db import db, User, CalendarEvent
+    from icalendar import Calendar
+    import calendar_index
+    from calendar_index import calendar_event_fields, common_free_slots
+    from loadtest import course_catalog, generate_ics
+
+    rng = random.Random(args.seed)
+    catalog = course_catalog(60, rng)
+    term_start, term_end = date(2024, 8, 26), date(2024, 12, 10)
+
+    with app.app_context():
+        users = [User(name=f"Student {i}", netid=f"bf{i}", password="x") for i in range(args.users)]
+        db.session.add_all(users)
+        db.session.commit()
+        events = 0
+        for user in users:
+            cal = Calendar.from_ical(generate_ics(rng.sample(catalog, 5), rng, term_start, term_end))
+            for component in cal.walk("VEVENT"):
+                db.session.add(CalendarEvent(user_id=user.id, term="FA24", **calendar_event_fields(component)))
+                events += 1
+        db.session.commit()
+        print(f"{args.users} users, {events} recurring events")
+
+        windows = {
+            "week": (datetime(2024, 12, 2), datetime(2024, 12, 9)),
+            "term": (datetime(2024, 8, 26), datetime(2024, 12, 11)),
+        }
+        print(f"{'window':<6} {'group':>5} {'cache':<5} {'p50 ms':>8} {'p95 ms':>8} {'slots':>7}")
+        for window_name, (window_start, window_end) in windows.items():
+            for group_size in [2, 5]:
+                for warm in [False, True]:
+                    groups = [rng.sample(users, group_size) for _ in range(args.queries)]
+                    if warm:
+                        for group in groups:
+                            common_free_slots(group, window_start, window_end)
+                    timings = []
+                    slots = 0
+                    for group in groups:
+                        if not warm:
+                            calendar_index._index_cache.clear()
+                        start = time.perf_counter()
+                        slots += len(common_free_slots(group, window_start, window_end))
+                        timings.append(time.perf_counter() - start)
+                    timings.sort()
+                    print(f"{window_name:<6} {group_size:>5} {'warm' if warm else 'cold':<5} "
+                          f"{percentile(timings, 50) * 1000:>8.2f} {percentile(timings, 95) * 1000:>8.2f} "
+                          f"{slots / len(groups):>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
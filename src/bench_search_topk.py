@@ -0,0 +1,101 @@
+"""
+Benchmark: top-K search with upper-bound pruning on large courses.
+
+For courses of increasing size, compares scoring every coursemate and sorting
+against top_k_matches, checks both return the same top K, and reports how many
+coursemates had their availability scored (the rest were pruned). Finally
+times /api/search/ itself on the largest course.
+
+    python bench_search_topk.py --sizes 1000,5000,20000 --k 10
+"""
+import argparse
+import random
+import tempfile
+import time
+from os import environ, path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Top-K search pruning benchmark")
+    parser.add_argument("--sizes", default="1000,5000,20000", help="course sizes to test")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20, help="searches per size (different searching users)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    scratch = tempfile.mkdtemp(prefix="studybuddy-bench-")
+    environ["DATABASE_URL"] = "sqlite:///" + path.join(scratch, "bench.db")
+    environ["AVAILABILITY_STORE_PATH"] = path.join(scratch, "availability.bin")
+    environ["SQLALCHEMY_ECHO"] = "false"
+    environ["ACTIVE_TERM"] = "FA24"
+    environ.setdefault("FLASK_SECRET_KEY", "bench-secret")
+
+    from app import app
+    from db import db, User, Course
+    from availability_store import PREFERENCE_FIELDS, pack_availability, pack_preferences
+    from schedule_data import compress_availability, bitset_preference_comparison, top_k_matches
+
+    rng = random.Random(args.seed)
+
+    def make_user(i):
+        user = User(name=f"Student {i}", netid=f"bk{i}", password="x")
+        # Realistic schedules: mostly free with a handful of class blocks
+        user.availability = compress_availability("".join(rng.choice("0111111") for _ in range(32 * 7)))
+        for pref in PREFERENCE_FIELDS:
+            setattr(user, pref, rng.random() < 0.4)
+        return user
+
+    print(f"{'size':>7} {'full ms':>9} {'top-k ms':>9} {'speedup':>8} {'scored':>8} {'pruned':>8}")
+    for size in sizes:
+        users = [make_user(i) for i in range(size)]
+        entries = [(i, pack_availability(u.availability), pack_preferences(u)) for i, u in enumerate(users)]
+
+        full_time = topk_time = 0.0
+        scored_total = 0
+        for _ in range(args.repeat):
+            me = rng.randrange(size)
+            _, my_bits, my_prefs = entries[me]
+            others = [e for e in entries if e[0] != me]
+
+            start = time.perf_counter()
+            full = sorted(((bitset_preference_comparison(my_bits, my_prefs, bits, prefs), uid)
+                           for uid, bits, prefs in others), key=lambda m: (-m[0], m[1]))[:args.k]
+            full_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            ranked, scored = top_k_matches(my_bits, my_prefs, others, args.k)
+            topk_time += time.perf_counter() - start
+            scored_total += scored
+
+            assert ranked == full, "top-k results differ from full sort"
+
+        candidates = (size - 1) * args.repeat
+        print(f"{size:>7} {full_time / args.repeat * 1000:>9.2f} {topk_time / args.repeat * 1000:>9.2f} "
+              f"{full_time / topk_time:>7.1f}x {scored_total / args.repeat:>8.0f} "
+              f"{1 - scored_total / candidates:>8.1%}")
+
+    # End to end: one course holding the largest population
+    size = sizes[-1]
+    with app.app_context():
+        course = Course(code="BENCH 1000", name="BENCH 1000", term="FA24")
+        course.students = [make_user(i) for i in range(size)]
+        db.session.add(course)
+        db.session.commit()
+        probe_id = course.students[0].id
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = probe_id
+    client.get("/api/search/")  # warm the availability store
+    for query in [{"limit": args.k}, {"limit": args.k, "offset": 40}]:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            response = client.get("/api/search/", query_string=query)
+            assert response.status_code == 200, response.data
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f"/api/search/ {query} on a {size}-student course: {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark: search latency as terms accumulate.
+
+Simulates several semesters of the same course catalog being uploaded. After
+each term is added it runs the archival job and times /api/search/ for a
+student enrolled in the newest term. With term-scoped courses the candidate
+set, and so the latency, should stay flat however many terms have passed.
+
+    python bench_terms.py --terms 8 --courses 30 --students 60
+"""
+import argparse
+import random
+import tempfile
+import time
+from os import environ, path
+from loadtest import percentile
+
+COURSE_NAMES = [f"{subject} {number}" for subject in ["CS", "MATH", "PHYS", "ECON", "ORIE"]
+                for number in range(1110, 5000, 130)]
+PREFERENCES = [
+    "location_north", "location_south", "location_central", "location_west",
+    "time_morning", "time_afternoon", "time_evening",
+    "objective_study", "objective_homework"
+]
+
+
+def terms_from(first_year, count):
+    """Consecutive spring/fall term codes starting with spring of first_year"""
+    terms = []
+    year = first_year
+    while len(terms) < count:
+        terms += [f"SP{year % 100:02d}", f"FA{year % 100:02d}"]
+        year += 1
+    return terms[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search latency as terms accumulate")
+    parser.add_argument("--terms", type=int, default=8)
+    parser.add_argument("--courses", type=int, default=30, help="courses offered each term")
+    parser.add_argument("--students", type=int, default=60, help="students enrolled per course each term")
+    parser.add_argument("--population", type=int, default=3000, help="size of the student body")
+    parser.add_argument("--repeat", type=int, default=30, help="searches timed per term")
+    parser.add_argument("--no-archive", action="store_true", help="skip the archival job between terms")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="studybuddy-bench-")
+    environ["DATABASE_URL"] = "sqlite:///" + path.join(scratch, "bench.db")
+    environ["AVAILABILITY_STORE_PATH"] = path.join(scratch, "availability.bin")
+    environ["SQLALCHEMY_ECHO"] = "false"
+    environ.setdefault("FLASK_SECRET_KEY", "bench-secret")
+
+    from app import app
+    from db import db, User, Course, course_students_table, archived_course_students_table
+    from archive import archive_past_terms
+    from schedule_data import compress_availability
+    from sqlalchemy import func, insert, select
+
+    rng = random.Random(args.seed)
+    catalog = COURSE_NAMES[:args.courses]
+
+    with app.app_context():
+        users = []
+        for i in range(args.population):
+            user = User(name=f"Student {i}", netid=f"bt{i}", password="x")
+            user.availability = compress_availability("".join(rng.choice("0111") for _ in range(32 * 7)))
+            for pref in PREFERENCES:
+                setattr(user, pref, rng.random() < 0.5)
+            users.append(user)
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [u.id for u in users]
+        probe_id = user_ids[0]
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["user_id"] = probe_id
+
+        print(f"{'terms':>5} {'term':>5} {'hot rows':>9} {'archived':>9} {'candidates':>10} {'p50 ms':>8} {'p95 ms':>8}")
+        for count, term in enumerate(terms_from(2021, args.terms), start=1):
+            courses = [Course(code=name, name=name, term=term) for name in catalog]
+            db.session.add_all(courses)
+            db.session.commit()
+
+            rows = []
+            for course in courses:
+                roster = set(rng.sample(user_ids, args.students))
+                roster.add(probe_id)
+                rows += [{"course_id": course.id, "user_id": uid} for uid in roster]
+            db.session.execute(insert(course_students_table), rows)
+            db.session.commit()
+
+            environ["ACTIVE_TERM"] = term
+            if not args.no_archive:
+                archive_past_terms(term)
+            db.session.expire_all()
+
+            hot = db.session.execute(select(func.count()).select_from(course_students_table)).scalar()
+            archived = db.session.execute(select(func.count()).select_from(archived_course_students_table)).scalar()
+            candidates = db.session.execute(
+                select(func.count(func.distinct(course_students_table.c.user_id)))
+                .join(Course, Course.id == course_students_table.c.course_id)
+                .where(Course.term == term)
+            ).scalar() - 1
+
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                response = client.get("/api/search/")
+                timings.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.data
+            timings.sort()
+            print(f"{count:>5} {term:>5} {hot:>9} {archived:>9} {candidates:>10} "
+                  f"{percentile(timings, 50) * 1000:>8.1f} {percentile(timings, 95) * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
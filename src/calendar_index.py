@@ -0,0 +1,227 @@
+"""
+Date-aware availability.
+
+The weekly template in User.availability can't answer "are we both free during
+the week of Dec 2nd?": it ignores RRULE UNTIL/INTERVAL, one-off events and
+rescheduled occurrences. Uploaded VEVENTs are therefore also kept as
+CalendarEvent rows, and this module expands them lazily over a requested date
+window into a per-user BusyIndex (merged intervals in sorted arrays, queried
+with binary search). Group free slots come from merging the members' indexes.
+
+Times are stored as naive wall-clock datetimes in one local zone
+(CALENDAR_TIMEZONE, America/New_York by default): UTC and TZID times are
+converted to it, floating times are taken as already local.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+from heapq import merge
+from os import getenv
+from dateutil import tz
+from dateutil.rrule import rrulestr
+from icalendar import vRecur
+from db import CalendarEvent
+
+MAX_WINDOW_DAYS = 180
+INDEX_CACHE_SIZE = 512
+
+# (user id, data_version, window start, window end) -> BusyIndex, least recently used first.
+# Shared by concurrent request threads, so only touch it while holding _index_cache_lock.
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+
+def calendar_timezone():
+    """The zone calendar times are compared in: CALENDAR_TIMEZONE if set, otherwise America/New_York"""
+    return tz.gettz(getenv("CALENDAR_TIMEZONE") or "America/New_York")
+
+def _naive(dt):
+    """Convert a calendar time to a naive wall-clock datetime in calendar_timezone()"""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(calendar_timezone())
+    return dt.replace(tzinfo=None)
+
+def calendar_event_fields(component):
+    """
+    Extract the CalendarEvent fields of a VEVENT
+
+    Returns:
+        dict or None: keyword arguments for CalendarEvent, or None for all-day events
+    """
+    dtstart = component.get('dtstart').dt
+    if not isinstance(dtstart, datetime):
+        return None
+    if component.get('dtend') is not None:
+        dtend = component.get('dtend').dt
+    elif component.get('duration') is not None:
+        dtend = dtstart + component.get('duration').dt
+    else:
+        dtend = dtstart
+
+    rrule = None
+    if component.get('rrule') is not None:
+        # UNTIL is usually in UTC, convert it like DTSTART so it can bound a naive recurrence
+        recur = vRecur(component.get('rrule'))
+        if 'UNTIL' in recur:
+            recur['UNTIL'] = [_naive(u) if isinstance(u, datetime) else u for u in recur['UNTIL']]
+        rrule = recur.to_ical().decode()
+
+    exdates = []
+    exdate_props = component.get('exdate') or []
+    if not isinstance(exdate_props, list):
+        exdate_props = [exdate_props]
+    for prop in exdate_props:
+        exdates += [_naive(d.dt).isoformat() for d in prop.dts if isinstance(d.dt, datetime)]
+
+    recurrence_id = component.get('recurrence-id')
+    summary = component.get('summary')
+    return {
+        "uid": str(component.get('uid')) if component.get('uid') else None,
+        "summary": str(summary) if summary else None,
+        "dtstart": _naive(dtstart),
+        "dtend": _naive(dtend),
+        "rrule": rrule,
+        "exdates": ",".join(exdates) or None,
+        "recurrence_id": _naive(recurrence_id.dt) if recurrence_id is not None else None,
+    }
+
+
+#### EXPANSION -----------------------------------------------------------
+def expand_events(events, window_start, window_end):
+    """
+    Yield the (start, end) busy intervals of events that overlap the window.
+    Recurrences are expanded lazily, only as far as the window needs, skipping
+    EXDATEs and occurrences replaced by a RECURRENCE-ID override.
+    """
+    overridden = {(e.uid, e.recurrence_id) for e in events if e.recurrence_id is not None}
+    for event in events:
+        duration = event.dtend - event.dtstart
+        if not event.rrule:
+            if event.dtstart < window_end and event.dtend > window_start:
+                yield event.dtstart, event.dtend
+            continue
+
+        excluded = {datetime.fromisoformat(d) for d in event.exdates.split(",")} if event.exdates else set()
+        rule = rrulestr(event.rrule, dtstart=event.dtstart)
+        # An occurrence overlaps the window iff it starts after window_start - duration
+        for start in rule.xafter(window_start - duration, inc=False):
+            if start >= window_end:
+                break
+            if start in excluded or (event.uid, start) in overridden:
+                continue
+            yield start, start + duration
+
+
+class BusyIndex:
+    """A user's busy time in a window, as merged intervals in two parallel sorted arrays"""
+
+    def __init__(self, intervals):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def intervals(self):
+        return zip(self.starts, self.ends)
+
+    def overlapping(self, start, end):
+        """Busy intervals overlapping [start, end)"""
+        first = bisect_right(self.ends, start)
+        last = bisect_left(self.starts, end)
+        return list(zip(self.starts[first:last], self.ends[first:last]))
+
+    def is_free(self, start, end):
+        """True if nothing is scheduled in [start, end)"""
+        return not self.overlapping(start, end)
+
+
+def busy_indexes(users, window_start, window_end):
+    """
+    BusyIndex for each user over the window, from the cache when the user's
+    data_version hasn't changed, otherwise expanded from their CalendarEvents
+
+    Returns:
+        dict: user id -> BusyIndex
+    """
+    indexes = {}
+    missing = []
+    with _index_cache_lock:
+        for user in users:
+            key = (user.id, user.data_version or 0, window_start, window_end)
+            index = _index_cache.get(key)
+            if index is not None:
+                _index_cache.move_to_end(key)
+                indexes[user.id] = index
+            else:
+                missing.append(user)
+    if missing:
+        # Query and expand outside the lock; if another thread builds the same index meanwhile, the last write wins
+        events_by_user = {user.id: [] for user in missing}
+        for event in CalendarEvent.query.filter(CalendarEvent.user_id.in_(list(events_by_user))).all():
+            events_by_user[event.user_id].append(event)
+        for user in missing:
+            indexes[user.id] = BusyIndex(expand_events(events_by_user[user.id], window_start, window_end))
+        with _index_cache_lock:
+            for user in missing:
+                key = (user.id, user.data_version or 0, window_start, window_end)
+                _index_cache[key] = indexes[user.id]
+                _index_cache.move_to_end(key)
+            while len(_index_cache) > INDEX_CACHE_SIZE:
+                _index_cache.popitem(last=False)
+    return indexes
+
+def users_without_events(users):
+    """
+    Users with no stored CalendarEvent rows. Their BusyIndex would be empty, so
+    they'd look free all day; this covers everyone who uploaded their calendar
+    before events were stored, until they upload it again.
+
+    Returns:
+        list: the given users that have no events, in the same order
+    """
+    rows = (CalendarEvent.query.with_entities(CalendarEvent.user_id)
+            .filter(CalendarEvent.user_id.in_([user.id for user in users])).distinct())
+    with_events = {user_id for (user_id,) in rows}
+    return [user for user in users if user.id not in with_events]
+
+
+#### FREE SLOTS ----------------------------------------------------------
+def common_free_slots(users, window_start, window_end, day_start=time(8), day_end=time(22), min_minutes=30):
+    """
+    Find the times in a window when every user is free
+
+    Args:
+        users: User objects to compare
+        window_start, window_end: datetimes bounding the search
+        day_start, day_end: only times between these each day are considered
+        min_minutes: shortest free slot to return
+
+    Returns:
+        list: (start, end) datetime tuples in chronological order
+    """
+    indexes = busy_indexes(users, window_start, window_end)
+    union = BusyIndex(merge(*(index.intervals() for index in indexes.values())))
+    minimum = timedelta(minutes=min_minutes)
+
+    slots = []
+    day = window_start.date()
+    while datetime.combine(day, time.min) < window_end:
+        cursor = max(window_start, datetime.combine(day, day_start))
+        close = min(window_end, datetime.combine(day, day_end))
+        if cursor < close:
+            for busy_start, busy_end in union.overlapping(cursor, close):
+                if busy_start - cursor >= minimum:
+                    slots.append((cursor, busy_start))
+                cursor = max(cursor, busy_end)
+            if close - cursor >= minimum:
+                slots.append((cursor, close))
+        day += timedelta(days=1)
+    return slots
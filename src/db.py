@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 
 db = SQLAlchemy()
 
@@ -7,7 +8,19 @@ course_students_table = db.Table(
     "course_students",
     db.Model.metadata,
     db.Column("course_id", db.Integer, db.ForeignKey("courses.id")),
-    db.Column("user_id", db.Integer, db.ForeignKey("users.id"))
+    db.Column("user_id", db.Integer, db.ForeignKey("users.id")),
+    db.Index("ix_course_students_course_id", "course_id"),
+    db.Index("ix_course_students_user_id", "user_id")
+)
+
+# Cold storage for enrollments in past terms, filled by archive.archive_past_terms
+archived_course_students_table = db.Table(
+    "archived_course_students",
+    db.Model.metadata,
+    db.Column("course_id", db.Integer, db.ForeignKey("courses.id")),
+    db.Column("user_id", db.Integer, db.ForeignKey("users.id")),
+    db.Column("term", db.String, nullable=False),
+    db.Index("ix_archived_course_students_user_id", "user_id")
 )
  
 
@@ -17,10 +30,12 @@ class User(db.Model):
     """
     __tablename__ = "users"
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    name = db.Column(db.String, nullable=False)
-    netid = db.Column(db.String, nullable=False)
+    name = db.Column(db.String(255), nullable=False, index=True)
+    netid = db.Column(db.String(64), nullable=False, index=True)
     password = db.Column(db.String(256), nullable=False)
     availability = db.Column(db.String, nullable=True)
+    # Bumped whenever availability or preferences change, see availability_store
+    data_version = db.Column(db.Integer, nullable=False, default=0)
     
     # Set default=False for all preference columns
     location_north = db.Column(db.Boolean, nullable=False, default=False)
@@ -40,6 +55,7 @@ class User(db.Model):
         self.name = kwargs.get('name', "")
         self.netid = kwargs.get('netid', "")
         self.password = kwargs.get('password', "")
+        self.data_version = 0
         
     
 
@@ -75,17 +91,21 @@ class Course(db.Model):
     Course model
     Has many-to-many relationships with User model (for both students and instructors)
     Has one-to-many relationship with Assignment model
+    A course is scoped to a single term (e.g. "FA24"), so each semester gets its own roster
     """
     __tablename__ = "courses"
+    __table_args__ = (db.UniqueConstraint("name", "term", name="uq_courses_name_term"),)
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    code = db.Column(db.String, nullable=False)
+    code = db.Column(db.String(64), nullable=False, index=True)
     name = db.Column(db.String, nullable=False)
+    term = db.Column(db.String, nullable=False, default="", index=True)
     students = db.relationship("User", secondary=course_students_table, back_populates="student_courses")
 
     def __init__(self, **kwargs):
         """Initialize a Course object"""
         self.code = kwargs.get("code", "")
         self.name = kwargs.get("name", "")
+        self.term = kwargs.get("term", "")
 
     def serialize(self):
         """Serialize a Course object"""
@@ -93,6 +113,7 @@ class Course(db.Model):
             "id": self.id,
             "code": self.code,
             "name": self.name,
+            "term": self.term,
             "students": [s.simple_serialize() for s in self.students],
         }
     def simple_serialize(self):
@@ -100,8 +121,77 @@ class Course(db.Model):
         return {
             "id": self.id,
             "code": self.code,
-            "name": self.name
+            "name": self.name,
+            "term": self.term
         }
 
 
-    
+class CalendarEvent(db.Model):
+    """
+    CalendarEvent model
+    A VEVENT from a user's uploaded calendar, kept so availability can be
+    computed for specific dates (see calendar_index)
+    """
+    __tablename__ = "calendar_events"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
+    term = db.Column(db.String, nullable=False, default="")
+    uid = db.Column(db.String, nullable=True)
+    summary = db.Column(db.String, nullable=True)
+    dtstart = db.Column(db.DateTime, nullable=False)
+    dtend = db.Column(db.DateTime, nullable=False)
+    rrule = db.Column(db.String, nullable=True)
+    exdates = db.Column(db.String, nullable=True)
+    recurrence_id = db.Column(db.DateTime, nullable=True)
+
+    def __init__(self, **kwargs):
+        """Initialize a CalendarEvent object"""
+        self.user_id = kwargs.get("user_id")
+        self.term = kwargs.get("term", "")
+        self.uid = kwargs.get("uid")
+        self.summary = kwargs.get("summary")
+        self.dtstart = kwargs.get("dtstart")
+        self.dtend = kwargs.get("dtend")
+        self.rrule = kwargs.get("rrule")
+        self.exdates = kwargs.get("exdates")
+        self.recurrence_id = kwargs.get("recurrence_id")
+
+    def serialize(self):
+        """Serialize a CalendarEvent object"""
+        return {
+            "id": self.id,
+            "term": self.term,
+            "summary": self.summary,
+            "dtstart": self.dtstart.isoformat(),
+            "dtend": self.dtend.isoformat(),
+            "rrule": self.rrule
+        }
+
+
+def add_missing_columns(default_term):
+    """
+    Bring a database created by an older version up to the current schema.
+    db.create_all() only creates missing tables, so columns and indexes added
+    to existing tables are created here. Must be called inside an app context.
+
+    Args:
+        default_term: term code given to courses that existed before courses
+            were scoped to terms, so their enrollments stay searchable
+    """
+    inspector = inspect(db.engine)
+    user_columns = {column["name"] for column in inspector.get_columns("users")}
+    if "data_version" not in user_columns:
+        db.session.execute(text("ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0"))
+
+    course_columns = {column["name"] for column in inspector.get_columns("courses")}
+    if "term" not in course_columns:
+        db.session.execute(text("ALTER TABLE courses ADD COLUMN term VARCHAR NOT NULL DEFAULT ''"))
+        db.session.execute(text("UPDATE courses SET term = :term"), {"term": default_term})
+        # create_all only builds the constraint with a new table, so add it as a unique index
+        db.session.execute(text("CREATE UNIQUE INDEX uq_courses_name_term ON courses (name, term)"))
+    db.session.commit()
+
+    # Indexes added to existing tables (course_students, users, courses)
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
@@ -0,0 +1,519 @@
+"""
+Load test harness for the study buddy backend.
+
+Drives the Flask app with a weighted mix of realistic requests (account
+creation, login, calendar uploads, preference updates, search and match
+emails) from a pool of simulated students, each holding its own session
+cookie. Reports throughput plus p50/p95/p99 latency and error rates per
+endpoint, and saves the results as JSON so runs can be compared.
+
+Examples:
+    # in-process, against a throwaway sqlite database
+    python loadtest.py --users 200 --requests 5000
+
+    # over HTTP against a local server started with
+    #   SMTP_HOST=127.0.0.1 SMTP_PORT=2525 SMTP_USE_TLS=false ACTIVE_TERM=FA24 python app.py
+    python loadtest.py --url http://127.0.0.1:8000 --smtp-port 2525
+
+    # compare against an earlier run
+    python loadtest.py --compare loadtest_results/20241201-101500.json
+"""
+import argparse
+import json
+import math
+import random
+import socketserver
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from io import BytesIO
+from os import environ, makedirs, path
+
+DEFAULT_MIX = "create=1,login=2,upload=1,preferences=2,search=6,email=1"
+
+PREFERENCES = [
+    "location_north", "location_south", "location_central", "location_west",
+    "time_morning", "time_afternoon", "time_evening",
+    "objective_study", "objective_homework"
+]
+
+SUBJECTS = ["CS", "MATH", "PHYS", "CHEM", "ENGRI", "ECON", "BIOG", "ORIE"]
+DAY_PATTERNS = ["MO,WE,FR", "TU,TH", "MO,WE", "TU", "WE", "FR"]
+
+
+#### TRAFFIC GENERATION --------------------------------------------------
+def parse_mix(mix_string):
+    """
+    Parse a traffic mix like "search=6,upload=1" into a dict of weights
+    """
+    mix = {}
+    for entry in mix_string.split(","):
+        op, _, weight = entry.partition("=")
+        op = op.strip()
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown operation in traffic mix: {op}")
+        mix[op] = float(weight) if weight else 1.0
+    return mix
+
+def course_catalog(size, rng):
+    """Build a list of distinct course codes such as "PHYS 2213" """
+    catalog = set()
+    while len(catalog) < size:
+        catalog.add(f"{rng.choice(SUBJECTS)} {rng.randint(10, 49) * 100 + rng.choice([10, 13, 40, 90])}")
+    return sorted(catalog)
+
+def generate_ics(courses, rng, term_start=date(2024, 8, 26), term_end=date(2024, 12, 10)):
+    """
+    Generate an ICS calendar in the same shape as the Cornell class roster export
+
+    Args:
+        courses: list of course codes to schedule
+        rng: random.Random used to pick meeting times
+
+    Returns:
+        bytes: the calendar file contents
+    """
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "CALSCALE:GREGORIAN",
+        "PRODID://Study Buddy//Load Test//EN",
+    ]
+    until = term_end.strftime("%Y%m%dT000000")
+    for course in courses:
+        for kind in ["Lecture", "Discussion"]:
+            days = rng.choice(DAY_PATTERNS)
+            first_day = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4}[days.split(",")[0]]
+            start = datetime.combine(term_start + timedelta(days=first_day), datetime.min.time())
+            start = start.replace(hour=rng.randint(8, 18), minute=rng.choice([0, 10, 25, 40]))
+            end = start + timedelta(minutes=rng.choice([50, 75, 115]))
+            lines += [
+                "BEGIN:VEVENT",
+                f"UID:{course.replace(' ', '-')}-{kind}-{rng.getrandbits(32)}@loadtest",
+                f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}",
+                f"RRULE:FREQ=WEEKLY;UNTIL={until};INTERVAL=1;BYDAY={days}",
+                f"DTEND:{end.strftime('%Y%m%dT%H%M%S')}",
+                f"SUMMARY;LANGUAGE=en-us:{course}\\, {kind}",
+                "END:VEVENT",
+            ]
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+#### CLIENTS -------------------------------------------------------------
+class InProcessClient:
+    """Issues requests through Flask's test client, which keeps its own cookie jar"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, url, body=None, upload=None):
+        """Send a request and return its status code"""
+        if upload is not None:
+            filename, contents = upload
+            response = self.client.open(url, method=method, data={"file": (BytesIO(contents), filename)},
+                                        content_type="multipart/form-data")
+        else:
+            response = self.client.open(url, method=method, data=json.dumps(body) if body is not None else None)
+        return response.status_code
+
+
+class HTTPClient:
+    """Issues requests over HTTP with a requests.Session holding the session cookie"""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+
+    def request(self, method, url, body=None, upload=None):
+        """Send a request and return its status code"""
+        files = {"file": upload} if upload is not None else None
+        data = json.dumps(body) if body is not None else None
+        response = self.session.request(method, self.base_url + url, data=data, files=files)
+        return response.status_code
+
+
+#### STAND-IN SMTP SERVER ------------------------------------------------
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib to log in and send, then drops the message"""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self.reply("220 loadtest SMTP sink")
+        in_data = False
+        for raw in self.rfile:
+            line = raw.decode(errors="replace").rstrip("\r\n")
+            if in_data:
+                if line == ".":
+                    in_data = False
+                    self.server.messages += 1
+                    self.reply("250 OK")
+                continue
+            command = line[:4].upper()
+            if command == "EHLO":
+                self.reply("250-loadtest")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif command == "AUTH":
+                self.reply("235 Authentication successful")
+            elif command == "DATA":
+                in_data = True
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Threaded SMTP sink that counts the messages it receives"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0):
+        super().__init__(("127.0.0.1", port), SMTPSinkHandler)
+        self.messages = 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address[1]
+
+
+#### SIMULATED STUDENTS --------------------------------------------------
+class Student:
+    """A simulated student with credentials, courses and a session of its own"""
+
+    def __init__(self, netid, catalog, rng, client):
+        self.netid = netid
+        self.name = f"Load Test {netid}"
+        self.password = f"pw-{netid}"
+        self.courses = rng.sample(catalog, k=min(len(catalog), rng.randint(3, 5)))
+        self.client = client
+        self.logged_in = False
+        self.uploaded = False
+
+
+def op_create(state, rng):
+    """Register a brand new student"""
+    student = state.new_student(rng)
+    def request():
+        status = student.client.request("POST", "/api/create/", body={
+            "name": student.name,
+            "netid": student.netid,
+            "password": student.password,
+            "confirm_password": student.password
+        })
+        if status == 201:
+            state.add_student(student)
+        return status
+    return request
+
+def op_login(state, rng):
+    """Log in an existing student, refreshing their session cookie"""
+    student = state.pick(rng)
+    def request():
+        status = student.client.request("POST", "/api/login/", body={
+            "netid": student.netid,
+            "password": student.password
+        })
+        student.logged_in = status == 200
+        return status
+    return request
+
+def op_upload(state, rng):
+    """Upload a freshly generated class schedule"""
+    student = state.pick_logged_in(rng)
+    contents = generate_ics(student.courses, rng)
+    filename = f"{student.netid}-{rng.getrandbits(32)}.ics"
+    def request():
+        status = student.client.request("POST", "/api/upload/", upload=(filename, contents))
+        if status == 200:
+            state.mark_uploaded(student)
+        return status
+    return request
+
+def op_preferences(state, rng):
+    """Update a random subset of preferences"""
+    student = state.pick_logged_in(rng)
+    body = {pref: rng.random() < 0.5 for pref in rng.sample(PREFERENCES, k=rng.randint(1, len(PREFERENCES)))}
+    return lambda: student.client.request("POST", "/api/user/preferences/", body=body)
+
+def op_search(state, rng):
+    """Search for study buddies (only students with a schedule, others get an expected 404)"""
+    student = state.pick_logged_in(rng, uploaded=True)
+    return lambda: student.client.request("GET", "/api/search/")
+
+def op_email(state, rng):
+    """Send a match email to another student"""
+    student = state.pick_logged_in(rng)
+    other = state.pick(rng)
+    return lambda: student.client.request("POST", "/api/send-email/", body={"sender_netid": other.netid})
+
+OPERATIONS = {
+    "create": op_create,
+    "login": op_login,
+    "upload": op_upload,
+    "preferences": op_preferences,
+    "search": op_search,
+    "email": op_email,
+}
+
+
+class LoadState:
+    """Shared pool of simulated students plus the latency samples collected so far"""
+
+    def __init__(self, client_factory, catalog):
+        self.client_factory = client_factory
+        self.catalog = catalog
+        self.students = []
+        self.uploaded = []
+        self.samples = {op: [] for op in OPERATIONS}
+        self.statuses = {op: {} for op in OPERATIONS}
+        self.lock = threading.Lock()
+        self.counter = 0
+
+    def new_student(self, rng):
+        with self.lock:
+            self.counter += 1
+            netid = f"lt{self.counter}x{rng.getrandbits(20):05x}"
+        return Student(netid, self.catalog, rng, self.client_factory())
+
+    def add_student(self, student):
+        with self.lock:
+            self.students.append(student)
+
+    def mark_uploaded(self, student):
+        with self.lock:
+            if not student.uploaded:
+                student.uploaded = True
+                self.uploaded.append(student)
+
+    def pick(self, rng, uploaded=False):
+        """Pick a random student, optionally only among those who uploaded a schedule"""
+        with self.lock:
+            return rng.choice(self.uploaded if uploaded and self.uploaded else self.students)
+
+    def pick_logged_in(self, rng, uploaded=False):
+        """
+        Pick a student, logging them in first if they have no session yet.
+        The login is recorded as a login sample of its own, so it never
+        inflates the latency of the request that needed it.
+        """
+        student = self.pick(rng, uploaded)
+        if not student.logged_in:
+            start = time.perf_counter()
+            status = student.client.request("POST", "/api/login/", body={"netid": student.netid, "password": student.password})
+            self.record("login", time.perf_counter() - start, status)
+            student.logged_in = True
+        return student
+
+    def record(self, op, elapsed, status):
+        with self.lock:
+            self.samples[op].append(elapsed)
+            self.statuses[op][status] = self.statuses[op].get(status, 0) + 1
+
+
+def seed_students(state, count, rng):
+    """Create, log in and upload a schedule for the initial population of students"""
+    for _ in range(count):
+        student = state.new_student(rng)
+        student.client.request("POST", "/api/create/", body={
+            "name": student.name,
+            "netid": student.netid,
+            "password": student.password,
+            "confirm_password": student.password
+        })
+        state.add_student(student)
+        student.client.request("POST", "/api/login/", body={"netid": student.netid, "password": student.password})
+        student.logged_in = True
+        status = student.client.request("POST", "/api/upload/", upload=(f"{student.netid}.ics", generate_ics(student.courses, rng)))
+        if status == 200:
+            state.mark_uploaded(student)
+        body = {pref: rng.random() < 0.5 for pref in PREFERENCES}
+        student.client.request("POST", "/api/user/preferences/", body=body)
+
+
+def run_worker(state, mix, requests_per_worker, deadline, seed):
+    """Issue weighted random requests until the request budget or deadline runs out"""
+    rng = random.Random(seed)
+    ops = list(mix.keys())
+    weights = [mix[op] for op in ops]
+    issued = 0
+    while issued < requests_per_worker and time.perf_counter() < deadline:
+        op = rng.choices(ops, weights=weights)[0]
+        # Operations pick their student and build the payload untimed, then return the request to time
+        start = None
+        try:
+            request = OPERATIONS[op](state, rng)
+            start = time.perf_counter()
+            status = request()
+        except Exception as e:
+            status = f"exception:{type(e).__name__}"
+        state.record(op, time.perf_counter() - start if start is not None else 0.0, status)
+        issued += 1
+
+
+#### REPORTING -----------------------------------------------------------
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def summarize(state, elapsed):
+    """
+    Build the results dictionary for a finished run
+
+    Returns:
+        dict: overall throughput plus per-endpoint latency percentiles (ms) and error rates
+    """
+    endpoints = {}
+    total = 0
+    total_errors = 0
+    for op, samples in state.samples.items():
+        if not samples:
+            continue
+        ordered = sorted(samples)
+        statuses = state.statuses[op]
+        errors = sum(n for status, n in statuses.items() if not (isinstance(status, int) and status < 400))
+        total += len(samples)
+        total_errors += errors
+        endpoints[op] = {
+            "count": len(samples),
+            "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(ordered, 50) * 1000,
+            "p95_ms": percentile(ordered, 95) * 1000,
+            "p99_ms": percentile(ordered, 99) * 1000,
+            "max_ms": ordered[-1] * 1000,
+            "error_rate": errors / len(samples),
+            "statuses": {str(status): n for status, n in sorted(statuses.items(), key=lambda x: str(x[0]))},
+        }
+    return {
+        "total_requests": total,
+        "elapsed_s": elapsed,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "error_rate": total_errors / total if total else 0.0,
+        "endpoints": endpoints,
+    }
+
+def print_report(results, previous=None):
+    """Print a per-endpoint table, with deltas against a previous run if given"""
+    print(f"\n{results['total_requests']} requests in {results['elapsed_s']:.2f}s "
+          f"-> {results['throughput_rps']:.1f} req/s, error rate {results['error_rate']:.2%}")
+    header = f"{'endpoint':<12}{'count':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}"
+    print(header)
+    print("-" * len(header))
+    for op, stats in results["endpoints"].items():
+        print(f"{op:<12}{stats['count']:>8}{stats['throughput_rps']:>9.1f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['error_rate']:>9.2%}")
+        if previous and op in previous["endpoints"]:
+            old = previous["endpoints"][op]
+            print(f"{'  vs prev':<12}{'':>8}{stats['throughput_rps'] - old['throughput_rps']:>+9.1f}"
+                  f"{stats['p50_ms'] - old['p50_ms']:>+10.2f}{stats['p95_ms'] - old['p95_ms']:>+10.2f}"
+                  f"{stats['p99_ms'] - old['p99_ms']:>+10.2f}{stats['error_rate'] - old['error_rate']:>+9.2%}")
+    if previous:
+        print(f"overall throughput vs previous run: {results['throughput_rps'] - previous['throughput_rps']:+.1f} req/s")
+
+
+#### ENTRY POINT ---------------------------------------------------------
+def build_client_factory(args, smtp_port):
+    """Return a zero-argument callable producing a fresh client per simulated student"""
+    if args.url:
+        return lambda: HTTPClient(args.url)
+
+    # The app reads its configuration at import time, so point it at a scratch
+    # database and the local SMTP sink before importing it.
+    if not environ.get("DATABASE_URL"):
+        scratch = tempfile.mkdtemp(prefix="studybuddy-loadtest-")
+        environ["DATABASE_URL"] = "sqlite:///" + path.join(scratch, "loadtest.db")
+        environ.setdefault("AVAILABILITY_STORE_PATH", path.join(scratch, "availability.bin"))
+    environ.setdefault("SQLALCHEMY_ECHO", "false")
+    environ.setdefault("FLASK_SECRET_KEY", "loadtest-secret")
+    environ.setdefault("ACTIVE_TERM", "FA24")  # generated calendars cover fall 2024
+    environ["SMTP_HOST"] = "127.0.0.1"
+    environ["SMTP_PORT"] = str(smtp_port)
+    environ["SMTP_USE_TLS"] = "false"
+    environ.setdefault("EMAIL_ADDRESS", "loadtest@example.com")
+    environ.setdefault("EMAIL_PASSWORD", "loadtest")
+    from app import app
+    return lambda: InProcessClient(app)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a realistic traffic mix against the study buddy backend")
+    parser.add_argument("--url", help="base URL of a running server; runs in-process when omitted")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted traffic mix (default: {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=100, help="students seeded before the measured run")
+    parser.add_argument("--courses", type=int, default=40, help="size of the course catalog")
+    parser.add_argument("--requests", type=int, default=2000, help="total measured requests")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    parser.add_argument("--concurrency", type=int, default=1, help="number of worker threads")
+    parser.add_argument("--smtp-port", type=int, default=0, help="port for the stand-in SMTP server (0 = any)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for reproducible traffic")
+    parser.add_argument("--output", default="loadtest_results", help="directory (or .json path) to save results to")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+
+    sink = SMTPSink(args.smtp_port)
+    smtp_port = sink.start()
+
+    state = LoadState(build_client_factory(args, smtp_port), course_catalog(args.courses, rng))
+    print(f"Seeding {args.users} students across {args.courses} courses...")
+    seed_students(state, args.users, rng)
+
+    print(f"Running {args.requests} requests with {args.concurrency} worker(s), mix {mix}")
+    per_worker = -(-args.requests // args.concurrency)
+    deadline = time.perf_counter() + args.duration if args.duration else float("inf")
+    workers = [
+        threading.Thread(target=run_worker, args=(state, mix, per_worker, deadline, args.seed + i + 1))
+        for i in range(args.concurrency)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    sink.shutdown()
+
+    results = summarize(state, elapsed)
+    results["config"] = {
+        "mode": "http" if args.url else "in-process",
+        "url": args.url,
+        "mix": mix,
+        "users": args.users,
+        "courses": args.courses,
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    results["emails_received"] = sink.messages
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(results, previous)
+
+    if args.output.endswith(".json"):
+        output_path = args.output
+        if path.dirname(output_path):
+            makedirs(path.dirname(output_path), exist_ok=True)
+    else:
+        makedirs(args.output, exist_ok=True)
+        output_path = path.join(args.output, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output_path}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+On-demand request profiling.
+
+A request is profiled when it carries an ``X-Profile-Token`` header matching
+the PROFILE_TOKEN environment variable, or when it is picked by random
+sampling (PROFILE_SAMPLE_RATE, a fraction between 0 and 1). A profiled request
+runs under cProfile plus a wall-clock stack sampler, and every SQL statement it
+issues is timed. Results are written to a bounded ring of recent profiles in
+PROFILE_DIR:
+
+    <id>.json       request metadata and SQL statements with timings
+    <id>.pstats     cProfile output, loadable with pstats / snakeviz
+    <id>.collapsed  folded stacks, ready for flamegraph.pl or speedscope
+
+Requests that are not profiled only pay for a header lookup (and a random()
+call when sampling is enabled). Settings are read by init_profiling, so values
+from .env are picked up as long as load_dotenv() runs before it.
+"""
+import cProfile
+import hmac
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from os import getenv, listdir, makedirs, path, remove, replace
+from random import random
+from uuid import uuid4
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Filled in from the environment by init_profiling
+PROFILE_TOKEN = None
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_DIR = "/tmp/studybuddy-profiles"
+PROFILE_MAX_FILES = 20
+PROFILE_SAMPLE_INTERVAL = 0.001
+
+PROFILE_HEADER = "X-Profile-Token"
+ARTIFACT_KINDS = {
+    "json": "application/json",
+    "pstats": "application/octet-stream",
+    "collapsed": "text/plain",
+}
+
+# Per-thread state of the request currently being profiled (None when idle)
+_active = threading.local()
+
+
+class StackSampler(threading.Thread):
+    """Periodically samples the call stack of one thread and counts folded stacks"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class RequestProfile:
+    """Everything collected while profiling a single request"""
+
+    def __init__(self, trigger):
+        self.id = f"{int(time.time() * 1000):013d}-{uuid4().hex[:8]}"
+        self.trigger = trigger
+        self.method = request.method
+        self.path = request.path
+        self.status = None
+        self.queries = []
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL)
+        self.started = time.perf_counter()
+
+    def start(self):
+        self.sampler.start()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        self.sampler.stop()
+        self.duration = time.perf_counter() - self.started
+
+    def metadata(self):
+        """Serialize the request summary and SQL timings"""
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "trigger": self.trigger,
+            "created_at": int(self.id.split("-")[0]) / 1000,
+            "duration_ms": round(self.duration * 1000, 3),
+            "sql_count": len(self.queries),
+            "sql_total_ms": round(sum(q["duration_ms"] for q in self.queries), 3),
+            "sql": self.queries,
+        }
+
+    def save(self, directory):
+        """Write the profile artifacts, metadata last so listings only see complete profiles"""
+        makedirs(directory, exist_ok=True)
+        base = path.join(directory, self.id)
+
+        self.profiler.dump_stats(base + ".pstats.tmp")
+        replace(base + ".pstats.tmp", base + ".pstats")
+
+        with open(base + ".collapsed.tmp", "w") as f:
+            for stack, count in self.sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        replace(base + ".collapsed.tmp", base + ".collapsed")
+
+        with open(base + ".json.tmp", "w") as f:
+            json.dump(self.metadata(), f, indent=2)
+        replace(base + ".json.tmp", base + ".json")
+
+
+#### SQL TIMING ----------------------------------------------------------
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_active, "profile", None) is not None:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = getattr(_active, "profile", None)
+    if profile is not None and conn.info.get("profile_query_start"):
+        elapsed = time.perf_counter() - conn.info["profile_query_start"].pop()
+        # Parameters are deliberately not recorded, they can contain password hashes
+        profile.queries.append({
+            "statement": statement,
+            "executemany": executemany,
+            "duration_ms": round(elapsed * 1000, 3),
+        })
+
+
+#### REQUEST HOOKS -------------------------------------------------------
+def is_authorized(req):
+    """True if the request carries the configured profiling token"""
+    if not PROFILE_TOKEN:
+        return False
+    return hmac.compare_digest(req.headers.get(PROFILE_HEADER, "").encode(), PROFILE_TOKEN.encode())
+
+def _start_profile():
+    if request.path.startswith("/api/admin/"):
+        return
+    if is_authorized(request):
+        trigger = "header"
+    elif PROFILE_SAMPLE_RATE > 0 and random() < PROFILE_SAMPLE_RATE:
+        trigger = "sample"
+    else:
+        return
+    profile = RequestProfile(trigger)
+    _active.profile = profile
+    profile.start()
+
+def _record_status(response):
+    profile = getattr(_active, "profile", None)
+    if profile is not None:
+        profile.status = response.status_code
+    return response
+
+def _finish_profile(exc):
+    profile = getattr(_active, "profile", None)
+    if profile is None:
+        return
+    _active.profile = None
+    profile.stop()
+    if exc is not None and profile.status is None:
+        profile.status = 500
+    try:
+        profile.save(PROFILE_DIR)
+        prune_profiles(PROFILE_DIR, PROFILE_MAX_FILES)
+    except OSError as e:
+        print(f"Failed to save profile {profile.id}: {e}")
+
+def init_profiling(app):
+    """Read the profiling settings from the environment and register the hooks on a Flask app"""
+    global PROFILE_TOKEN, PROFILE_SAMPLE_RATE, PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_SAMPLE_INTERVAL
+    PROFILE_TOKEN = getenv("PROFILE_TOKEN") or None
+    PROFILE_SAMPLE_RATE = float(getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_DIR = getenv("PROFILE_DIR", "/tmp/studybuddy-profiles")
+    PROFILE_MAX_FILES = int(getenv("PROFILE_MAX_FILES", "20"))
+    PROFILE_SAMPLE_INTERVAL = float(getenv("PROFILE_SAMPLE_INTERVAL_MS", "1")) / 1000
+    app.before_request(_start_profile)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_profile)
+
+
+#### PROFILE STORE -------------------------------------------------------
+def list_profiles(directory=None):
+    """Return metadata summaries of the stored profiles, newest first"""
+    directory = directory or PROFILE_DIR
+    if not path.isdir(directory):
+        return []
+    profiles = []
+    for filename in sorted(listdir(directory), reverse=True):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(path.join(directory, filename)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta.pop("sql", None)
+        profiles.append(meta)
+    return profiles
+
+def profile_artifact_path(profile_id, kind, directory=None):
+    """
+    Return the on-disk path of one artifact of a stored profile
+
+    Returns:
+        str or None: the path, or None if the id/kind is invalid or the file is gone
+    """
+    directory = directory or PROFILE_DIR
+    if kind not in ARTIFACT_KINDS or not profile_id.replace("-", "").isalnum():
+        return None
+    artifact = path.join(directory, f"{profile_id}.{kind}")
+    return artifact if path.isfile(artifact) else None
+
+def prune_profiles(directory, max_profiles):
+    """Delete the oldest profiles so at most max_profiles remain"""
+    ids = sorted({f.split(".")[0] for f in listdir(directory) if f.endswith(".json")})
+    for profile_id in ids[:max(0, len(ids) - max_profiles)]:
+        for kind in ARTIFACT_KINDS:
+            try:
+                remove(path.join(directory, f"{profile_id}.{kind}"))
+            except FileNotFoundError:
+                pass
@@ -1,6 +1,9 @@
+import heapq
 from icalendar import Calendar
-from datetime import datetime, time
+from datetime import date, datetime, time
+from os import getenv
 from db import User
+from availability_store import get_store, BLOCKS, PREFERENCE_FIELDS
 #from dateutil.rrule import rrulestr
 #import pytz
 #import boto3
@@ -12,6 +15,37 @@ def time_to_block_index(dt):
     minutes_since_8am = (t.hour - 8) * 60 + t.minute
     return max(0, min(31, minutes_since_8am // 30))  # Ensure index is between 0 and 31
 
+# Terms in calendar order with the months whose dates fall in them
+TERM_SEASONS = [("SP", range(1, 6)), ("SU", range(6, 8)), ("FA", range(8, 13))]
+
+def term_for_date(d):
+    """Return the term code (e.g. "FA24") that a date falls in"""
+    for season, months in TERM_SEASONS:
+        if d.month in months:
+            return f"{season}{d.year % 100:02d}"
+
+def term_sort_key(term):
+    """Sort key putting term codes in calendar order, e.g. SP24 < SU24 < FA24 < SP25"""
+    seasons = [season for season, _ in TERM_SEASONS]
+    return (int(term[2:]), seasons.index(term[:2]))
+
+def active_term():
+    """The term searches are limited to: ACTIVE_TERM if set, otherwise today's term"""
+    return getenv("ACTIVE_TERM") or term_for_date(date.today())
+
+def event_term(dtstart, rrule=None):
+    """
+    Derive the term of a calendar event from its DTSTART and RRULE UNTIL.
+    Uses the midpoint of the recurrence so a class starting in late August
+    and ending in December is assigned to the fall term.
+    """
+    start = dtstart.date() if isinstance(dtstart, datetime) else dtstart
+    end = start
+    if rrule and rrule.get('until'):
+        until = rrule['until'][0]
+        end = until.date() if isinstance(until, datetime) else until
+    return term_for_date(start + (end - start) / 2)
+
 def process_calendar_file(calendar_file):
 
     """
@@ -153,7 +187,106 @@ def percentage_availability_match(compressed_availability1, compressed_availabil
     
     return sum(1 for i in range(len(availability1)) if availability1[i] == '1' and availability2[i] == '1') / len(availability1)
 
+# Preference bitmask groups, in availability_store.PREFERENCE_FIELDS order
+LOCATION_MASK = 0b000001111
+TIME_MASK = 0b001110000
+OBJECTIVE_MASK = 0b110000000
+
+def _group_score(prefs1, prefs2, mask):
+    """Fraction of the preferences in a group chosen by either user that both chose"""
+    total = ((prefs1 | prefs2) & mask).bit_count()
+    return ((prefs1 & prefs2) & mask).bit_count() / total if total > 0 else 0
+
+def _weighted_score(availability_score, prefs1, prefs2):
+    """Availability: 40%, Location: 25%, Time: 25%, Objective: 10%"""
+    return (
+        (availability_score * 0.4) +
+        (_group_score(prefs1, prefs2, LOCATION_MASK) * 0.25) +
+        (_group_score(prefs1, prefs2, TIME_MASK) * 0.25) +
+        (_group_score(prefs1, prefs2, OBJECTIVE_MASK) * 0.1)
+    ) * 100
+
+def bitset_preference_comparison(bits1, prefs1, bits2, prefs2):
+    """
+    Same score as orm_preference_comparison, computed from packed availability
+    bitsets and preference bitmasks (see availability_store)
+    """
+    if bits1 is not None and bits2 is not None:
+        availability_score = (bits1 & bits2).bit_count() / BLOCKS
+    else:
+        availability_score = 0
+    return round(_weighted_score(availability_score, prefs1, prefs2))
+
+def top_k_matches(user_bits, user_prefs, candidates, k):
+    """
+    Find the k best scoring candidates without scoring all of them.
+
+    Each candidate first gets an upper bound from the exact preference terms
+    (60% of the score) plus the best availability overlap it could have, which
+    is the user's own free blocks. Candidates are visited by decreasing bound
+    and the scan stops once a bound can no longer beat the worst of the current
+    top k, so the rest never have their availability compared.
+
+    Args:
+        user_bits, user_prefs: packed availability and preferences of the searching user
+        candidates: iterable of (user id, availability bits, preference mask)
+        k: number of results wanted
+
+    Returns:
+        tuple: ([(score, user id)] best first with ties broken by lower id,
+                number of candidates whose availability was scored)
+    """
+    if k <= 0:
+        return [], 0
+    best_overlap = user_bits.bit_count() / BLOCKS if user_bits is not None else 0
+
+    # The bound only depends on the candidate's preference mask (and whether they
+    # have a schedule), so compute it once per possible mask and bucket by it
+    masks = 1 << len(PREFERENCE_FIELDS)
+    bound_with_schedule = [round(_weighted_score(best_overlap, user_prefs, mask)) for mask in range(masks)]
+    bound_without_schedule = [round(_weighted_score(0, user_prefs, mask)) for mask in range(masks)]
+    buckets = {}
+    for candidate in candidates:
+        table = bound_with_schedule if candidate[1] is not None else bound_without_schedule
+        buckets.setdefault(table[candidate[2]], []).append(candidate)
+
+    heap = []  # min-heap of (score, -id), so heap[0] is the worst kept match
+    scored = 0
+    for bound in sorted(buckets, reverse=True):
+        if len(heap) == k and bound < heap[0][0]:
+            break
+        for candidate_id, bits, prefs in sorted(buckets[bound]):
+            if len(heap) == k and (bound, -candidate_id) < heap[0]:
+                break
+            scored += 1
+            entry = (bitset_preference_comparison(user_bits, user_prefs, bits, prefs), -candidate_id)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    ranked = sorted(heap, reverse=True)
+    return [(score, -negative_id) for score, negative_id in ranked], scored
+
 def preference_comparison(user1, user2):
+    """
+    Compare preferences between two users and return a percentage match score.
+    Reads packed bits from the shared availability store when it is enabled,
+    otherwise decodes the User rows directly.
+    
+    Args:
+        user1: User object for first user
+        user2: User object for second user
+        
+    Returns:
+        float: Percentage match score (0-100)
+    """
+    store = get_store()
+    if store is None:
+        return orm_preference_comparison(user1, user2)
+    return bitset_preference_comparison(*store.lookup(user1), *store.lookup(user2))
+
+def orm_preference_comparison(user1, user2):
     """
     Compare preferences between two users and return a percentage match score.
     Weighs availability (40%), location (25%), time (25%), and objective (10%).
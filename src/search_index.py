@@ -0,0 +1,169 @@
+"""
+Text index for user and course autocomplete.
+
+On SQLite the index is a pair of FTS5 virtual tables (users_fts, courses_fts)
+whose rowids mirror the users/courses primary keys, with prefix indexes so
+"phy" or "nt3" style queries are answered from the index. Rows are kept in sync
+by mapper events, inside the same transaction that creates or updates the
+user/course. On databases without FTS5 (e.g. MySQL) queries fall back to
+prefix LIKE matches on the indexed users.name/netid and courses.code columns
+(uploaded courses use their name as their code, so code alone is searched).
+"""
+import re
+from sqlalchemy import event, inspect, or_, text
+from sqlalchemy.exc import OperationalError
+from db import db, User, Course
+
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+# "fts5" once the virtual tables exist, otherwise "prefix"
+_backend = "prefix"
+
+
+def search_backend():
+    """Name of the backend answering autocomplete queries"""
+    return _backend
+
+def _fts_query(query):
+    """Turn free text into an FTS5 query matching every word as a prefix"""
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words)
+
+def _like_prefix(query):
+    """Escape LIKE wildcards and append the prefix wildcard"""
+    return query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+#### INDEX MAINTENANCE ---------------------------------------------------
+def _index_user(mapper, connection, user):
+    connection.execute(text("DELETE FROM users_fts WHERE rowid = :id"), {"id": user.id})
+    connection.execute(text("INSERT INTO users_fts(rowid, name, netid) VALUES (:id, :name, :netid)"),
+                       {"id": user.id, "name": user.name, "netid": user.netid})
+
+def _reindex_user(mapper, connection, user):
+    state = inspect(user)
+    if state.attrs.name.history.has_changes() or state.attrs.netid.history.has_changes():
+        _index_user(mapper, connection, user)
+
+def _unindex_user(mapper, connection, user):
+    connection.execute(text("DELETE FROM users_fts WHERE rowid = :id"), {"id": user.id})
+
+def _index_course(mapper, connection, course):
+    connection.execute(text("DELETE FROM courses_fts WHERE rowid = :id"), {"id": course.id})
+    connection.execute(text("INSERT INTO courses_fts(rowid, code, name, term) VALUES (:id, :code, :name, :term)"),
+                       {"id": course.id, "code": course.code, "name": course.name, "term": course.term})
+
+def _reindex_course(mapper, connection, course):
+    state = inspect(course)
+    if any(state.attrs[key].history.has_changes() for key in ("code", "name", "term")):
+        _index_course(mapper, connection, course)
+
+def _unindex_course(mapper, connection, course):
+    connection.execute(text("DELETE FROM courses_fts WHERE rowid = :id"), {"id": course.id})
+
+def rebuild_search_index():
+    """Repopulate the FTS tables from users and courses (needed after bulk loads)"""
+    if _backend != "fts5":
+        return
+    db.session.execute(text("DELETE FROM users_fts"))
+    db.session.execute(text("INSERT INTO users_fts(rowid, name, netid) SELECT id, name, netid FROM users"))
+    db.session.execute(text("DELETE FROM courses_fts"))
+    db.session.execute(text("INSERT INTO courses_fts(rowid, code, name, term) SELECT id, code, name, term FROM courses"))
+    db.session.commit()
+
+def init_search_index(app):
+    """
+    Create the FTS5 tables if the database supports them, register the sync
+    events and backfill rows that were created before the index existed
+    """
+    global _backend
+    with app.app_context():
+        if db.engine.dialect.name != "sqlite":
+            return
+        try:
+            db.session.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(name, netid, prefix='2 3 4')"
+            ))
+            db.session.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS courses_fts USING fts5(code, name, term UNINDEXED, prefix='2 3 4')"
+            ))
+            db.session.commit()
+        except OperationalError:
+            db.session.rollback()
+            return
+
+        _backend = "fts5"
+        handlers = [
+            (User, _index_user, _reindex_user, _unindex_user),
+            (Course, _index_course, _reindex_course, _unindex_course),
+        ]
+        for model, index, reindex, unindex in handlers:
+            if not event.contains(model, "after_insert", index):
+                event.listen(model, "after_insert", index)
+                event.listen(model, "after_update", reindex)
+                event.listen(model, "after_delete", unindex)
+
+        indexed = db.session.execute(text("SELECT count(*) FROM users_fts")).scalar()
+        indexed += db.session.execute(text("SELECT count(*) FROM courses_fts")).scalar()
+        if indexed != User.query.count() + Course.query.count():
+            rebuild_search_index()
+
+
+#### QUERIES -------------------------------------------------------------
+def autocomplete_users(query, limit=AUTOCOMPLETE_DEFAULT_LIMIT):
+    """
+    Find users whose name or netid starts with the query (any word of the name on FTS5)
+
+    Returns:
+        list: simple_serialize() dicts, best matches first
+    """
+    if _backend == "fts5":
+        match = _fts_query(query)
+        if not match:
+            return []
+        rows = db.session.execute(text(
+            "SELECT rowid FROM users_fts WHERE users_fts MATCH :match ORDER BY rank LIMIT :limit"
+        ), {"match": match, "limit": limit}).fetchall()
+        ids = [row[0] for row in rows]
+        users = {u.id: u for u in User.query.filter(User.id.in_(ids)).all()}
+        return [users[i].simple_serialize() for i in ids if i in users]
+
+    pattern = _like_prefix(query)
+    users = (
+        User.query
+        .filter(or_(User.netid.like(pattern, escape="\\"), User.name.like(pattern, escape="\\")))
+        .order_by(db.func.length(User.netid), User.netid)
+        .limit(limit)
+        .all()
+    )
+    return [u.simple_serialize() for u in users]
+
+def autocomplete_courses(query, term, limit=AUTOCOMPLETE_DEFAULT_LIMIT):
+    """
+    Find courses in the given term whose code or name starts with the query
+
+    Returns:
+        list: simple_serialize() dicts, best matches first
+    """
+    if _backend == "fts5":
+        match = _fts_query(query)
+        if not match:
+            return []
+        rows = db.session.execute(text(
+            "SELECT rowid FROM courses_fts WHERE courses_fts MATCH :match AND term = :term ORDER BY rank LIMIT :limit"
+        ), {"match": match, "term": term, "limit": limit}).fetchall()
+        ids = [row[0] for row in rows]
+        courses = {c.id: c for c in Course.query.filter(Course.id.in_(ids)).all()}
+        return [courses[i].simple_serialize() for i in ids if i in courses]
+
+    pattern = _like_prefix(query)
+    courses = (
+        Course.query
+        .filter(Course.term == term)
+        .filter(Course.code.like(pattern, escape="\\"))
+        .order_by(Course.code)
+        .limit(limit)
+        .all()
+    )
+    return [c.simple_serialize() for c in courses]